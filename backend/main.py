@@ -2,23 +2,58 @@
 Payment Portal Backend API
 FastAPI backend with simulated payment processing
 """
-from fastapi import FastAPI, Request, HTTPException, BackgroundTasks
+from fastapi import FastAPI, Header, Query, Request, Response, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse
 from pydantic import BaseModel, Field
 from typing import Optional, List
+from collections import defaultdict, deque
+from functools import lru_cache
+from itertools import count, islice
+import asyncio
 import hashlib
-import uuid
+import heapq
+import logging
+import os
+import queue
+import secrets
+import time
+from logging.handlers import QueueHandler, QueueListener
 from datetime import datetime
-import json
-from pydantic import BaseModel, Field, EmailStr 
+import orjson
 
 # Initialize FastAPI app
 app = FastAPI(
     title="Payment Portal API",
     description="Demo payment gateway integration backend",
-    version="1.0.0"
+    version="1.0.0",
+    default_response_class=ORJSONResponse
 )
 
+# Logging: while the app is serving, records are queued here and written to
+# stderr by a listener thread; otherwise they go to stderr directly, so the
+# queue never fills up with records nobody is consuming
+log_stream_handler = logging.StreamHandler()
+log_queue = queue.Queue(-1)
+log_queue_handler = QueueHandler(log_queue)
+log_listener = QueueListener(log_queue, log_stream_handler)
+logger = logging.getLogger("webhooks")
+logger.setLevel(logging.INFO)
+logger.addHandler(log_stream_handler)
+logger.propagate = False
+
+def start_log_listener():
+    """Route webhook logging through the queue and its listener thread"""
+    log_listener.start()
+    logger.addHandler(log_queue_handler)
+    logger.removeHandler(log_stream_handler)
+
+def stop_log_listener():
+    """Go back to direct stderr logging, then drain the queue and stop the listener"""
+    logger.addHandler(log_stream_handler)
+    logger.removeHandler(log_queue_handler)
+    log_listener.stop()
+
 # Enable CORS for frontend
 app.add_middleware(
     CORSMiddleware,
@@ -29,8 +64,28 @@ app.add_middleware(
 )
 
 # In-memory database
-transactions_db = []
-webhook_logs = []
+transactions_db = deque()
+WEBHOOK_LOG_SIZE = 10000
+webhook_logs = deque(maxlen=WEBHOOK_LOG_SIZE)  # most recent events only
+webhook_logs_total = 0  # lifetime count, including evicted events
+
+# Webhook events are queued by the handlers and written to webhook_logs in batches
+WEBHOOK_BATCH_SIZE = 100
+WEBHOOK_FLUSH_INTERVAL = 0.05  # seconds
+webhook_queue: Optional[asyncio.Queue] = None  # created on startup, in the serving loop
+webhook_flusher_task: Optional[asyncio.Task] = None
+
+# Hash indexes over transactions_db (all hold references to the same dicts).
+# Rows stay as dicts because responses return whole rows; filtering goes
+# through these indexes, so no request scans the full table.
+transactions_by_order: dict = {}
+transactions_by_email = defaultdict(list)
+transactions_by_status = defaultdict(dict)  # status -> {transaction id: transaction}
+transaction_seq: dict = {}  # transaction id -> creation sequence, for ordering status buckets
+_next_seq = count()
+transactions_version = 0  # bumped on every change; used as the listing ETag
+# Per-process prefix so ETags from before a restart (or reload) never match
+_BOOT_ID = secrets.token_hex(4)
 
 # Pydantic models
 class PaymentRequest(BaseModel):
@@ -51,55 +106,209 @@ class PaymentResponse(BaseModel):
     message: str
 
 class Transaction(BaseModel):
-    """Transaction model"""
+    """Transaction model (shape of a stored row; timestamps are ISO 8601 strings)"""
     id: str
     order_id: str
     amount: float
     currency: str
     customer_email: str
     status: str
-    created_at: datetime
-    updated_at: datetime
+    created_at: str
+    updated_at: str
+
+class TransactionList(BaseModel):
+    """Transaction listing response model"""
+    count: int
+    transactions: List[Transaction]
 
 # Helper functions
+_order_ts_cache = [0, ""]  # [epoch second, formatted timestamp]
+
+def order_timestamp() -> str:
+    """Order ID timestamp (local time), formatted at most once per second"""
+    sec = int(time.time())
+    if sec != _order_ts_cache[0]:
+        _order_ts_cache[1] = time.strftime("%Y%m%d%H%M%S", time.localtime(sec))
+        _order_ts_cache[0] = sec
+    return _order_ts_cache[1]
+
+_iso_ts_cache = [0, ""]  # [epoch millisecond, ISO timestamp]
+
+def isoformat_now() -> str:
+    """datetime.now().isoformat(), reused for calls within the same millisecond"""
+    ms = time.time_ns() // 1_000_000
+    if ms != _iso_ts_cache[0]:
+        _iso_ts_cache[1] = datetime.now().isoformat()
+        _iso_ts_cache[0] = ms
+    return _iso_ts_cache[1]
+
+@lru_cache(maxsize=8192)
+def email_hash6(email: str) -> str:
+    """Six hex character fingerprint of an email, cached for repeat customers"""
+    return hashlib.blake2b(email.encode(), digest_size=3).hexdigest().upper()
+
 def generate_order_id(email: str) -> str:
     """Generate unique order ID"""
-    timestamp = datetime.now().strftime("%Y%m%d%H%M%S")
-    email_hash = hashlib.sha256(email.encode()).hexdigest()[:6].upper()
-    return f"ORD{timestamp}{email_hash}"
+    timestamp = order_timestamp()
+    email_hash = email_hash6(email)
+    order_id = f"ORD{timestamp}{email_hash}"
+    # Same email in the same second (e.g. a double submit): add a counter
+    n = 1
+    while order_id in transactions_by_order:
+        n += 1
+        order_id = f"ORD{timestamp}{email_hash}-{n}"
+    return order_id
+
+def index_transaction(transaction: dict):
+    """Store a transaction and add it to every index"""
+    global transactions_version
+    transactions_version += 1
+    transactions_db.append(transaction)
+    transaction_seq[transaction["id"]] = next(_next_seq)
+    transactions_by_order[transaction["order_id"]] = transaction
+    transactions_by_email[transaction["customer_email"]].append(transaction)
+    transactions_by_status[transaction["status"]][transaction["id"]] = transaction
+
+def creation_order(transactions, limit: Optional[int] = None) -> list:
+    """Status-bucket rows in creation order (buckets are ordered by status change)"""
+    key = lambda t: transaction_seq[t["id"]]
+    if limit is None:
+        return sorted(transactions, key=key)
+    return heapq.nsmallest(limit, transactions, key=key)
+
+def update_transaction_status(transaction: dict, status: str):
+    """Change a transaction's status and move it to the matching status bucket"""
+    if transaction["status"] == status:
+        # Retried webhook with the same status; nothing to move
+        return
+    # Look up the new bucket first: an unusable status fails here, before the
+    # transaction has been taken out of its current bucket
+    new_bucket = transactions_by_status[status]
+    global transactions_version
+    transactions_version += 1
+    tx_id = transaction["id"]
+    old_bucket = transactions_by_status.get(transaction["status"])
+    if old_bucket is not None:
+        old_bucket.pop(tx_id, None)
+        if not old_bucket:
+            del transactions_by_status[transaction["status"]]
+    transaction["status"] = status
+    transaction["updated_at"] = isoformat_now()
+    new_bucket[tx_id] = transaction
+
+_PAY_URL_PREFIX = "https://payment-gateway-demo.com/pay/"
 
 def simulate_payment_gateway_call(order_data: dict) -> dict:
     """Simulate calling a real payment gateway"""
     return {
-        "id": f"pay_{uuid.uuid4().hex[:10]}",
+        "id": "pay_" + os.urandom(5).hex(),
         "status": "created",
-        "redirect_url": f"https://payment-gateway-demo.com/pay/{order_data['order_id']}"
+        "redirect_url": _PAY_URL_PREFIX + order_data["order_id"]
     }
 
-def log_webhook(event_data: dict):
-    """Log webhook events"""
-    webhook_logs.append({
-        **event_data,
-        "received_at": datetime.now().isoformat()
-    })
-    print(f"🔔 Webhook logged: {event_data}")
+def log_webhook(event_data: dict, new_status: Optional[str] = None):
+    """Queue a webhook event for the batch flusher, optionally with a status to apply"""
+    if webhook_flusher_task is None:
+        # App running without lifespan events (e.g. TestClient without `with`)
+        write_webhook_batch([(event_data, new_status)])
+        return
+    webhook_queue.put_nowait((event_data, new_status))
+
+def write_webhook_batch(batch: List[tuple]):
+    """Apply queued status updates, then log the batch with a shared timestamp"""
+    global webhook_logs_total
+    for event_data, new_status in batch:
+        if new_status is None:
+            continue
+        # One bad event must not cost the rest of the batch its updates
+        try:
+            transaction = transactions_by_order.get(event_data["order_id"])
+            if transaction is not None:
+                update_transaction_status(transaction, new_status)
+        except Exception:
+            logger.exception("Failed to apply webhook status for order %r", event_data.get("order_id"))
+    webhook_logs_total += len(batch)
+    received_at = datetime.now().isoformat()
+    webhook_logs.extend({**event_data, "received_at": received_at} for event_data, _ in batch)
+    if logger.isEnabledFor(logging.INFO):
+        logger.info("🔔 Webhooks logged: %d", len(batch))
+
+def flush_webhook_batch(batch: List[tuple]):
+    """write_webhook_batch, logging failures so the flusher keeps running"""
+    try:
+        write_webhook_batch(batch)
+    except Exception:
+        logger.exception("Failed to write %d webhook events", len(batch))
+
+_STOP_FLUSHER = object()  # queued at shutdown; the flusher exits once it is reached
+
+async def webhook_flusher():
+    """Process the webhook queue every WEBHOOK_FLUSH_INTERVAL or WEBHOOK_BATCH_SIZE events"""
+    loop = asyncio.get_running_loop()
+    stopping = False
+    while not stopping:
+        item = await webhook_queue.get()
+        if item is _STOP_FLUSHER:
+            break
+        batch = [item]
+        deadline = loop.time() + WEBHOOK_FLUSH_INTERVAL
+        while len(batch) < WEBHOOK_BATCH_SIZE:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                item = await asyncio.wait_for(webhook_queue.get(), timeout)
+            except asyncio.TimeoutError:
+                break
+            if item is _STOP_FLUSHER:
+                stopping = True
+                break
+            batch.append(item)
+        flush_webhook_batch(batch)
+
+# Lifecycle events
+@app.on_event("startup")
+async def start_webhook_flusher():
+    global webhook_queue, webhook_flusher_task
+    start_log_listener()
+    # Fresh queue for this event loop; an asyncio.Queue is tied to the first
+    # loop that waits on it, and the previous run (if any) was drained on shutdown
+    webhook_queue = asyncio.Queue()
+    webhook_flusher_task = asyncio.create_task(webhook_flusher())
+
+@app.on_event("shutdown")
+async def stop_webhook_flusher():
+    global webhook_flusher_task
+    # Let the flusher finish everything queued (including its current batch)
+    # so acknowledged webhooks are not lost on shutdown
+    webhook_queue.put_nowait(_STOP_FLUSHER)
+    await webhook_flusher_task
+    webhook_flusher_task = None
+    stop_log_listener()
+
+# Pre-serialized bodies for the probe endpoints
+_ROOT_JSON = orjson.dumps({
+    "message": "Payment Portal API",
+    "version": "1.0.0",
+    "endpoints": {
+        "create_payment": "POST /api/v1/payments",
+        "get_transactions": "GET /api/v1/transactions",
+        "webhook": "POST /api/v1/webhooks/payment"
+    }
+})
+_HEALTH_TMPL = b'{"status":"healthy","timestamp":"%s","transactions_count":%d,"webhooks_count":%d}'
 
 # API Endpoints
 @app.get("/")
 async def root():
-    return {
-        "message": "Payment Portal API",
-        "version": "1.0.0",
-        "endpoints": {
-            "create_payment": "POST /api/v1/payments",
-            "get_transactions": "GET /api/v1/transactions",
-            "webhook": "POST /api/v1/webhooks/payment"
-        }
-    }
+    return Response(content=_ROOT_JSON, media_type="application/json")
 
 @app.post("/api/v1/payments", response_model=PaymentResponse)
-async def create_payment(payment: PaymentRequest, background_tasks: BackgroundTasks):
+async def create_payment(payment: PaymentRequest):
+    # No I/O and only a few microseconds of CPU (cached hash/timestamp), so this
+    # stays on the event loop; the index updates must not run in another thread
     try:
+        now = datetime.now().isoformat()
         order_id = generate_order_id(payment.customer_email)
         
         gateway_response = simulate_payment_gateway_call({
@@ -109,23 +318,23 @@ async def create_payment(payment: PaymentRequest, background_tasks: BackgroundTa
             "customer_email": payment.customer_email
         })
         
-        transaction = Transaction(
-            id=str(uuid.uuid4()),
-            order_id=order_id,
-            amount=payment.amount,
-            currency=payment.currency,
-            customer_email=payment.customer_email,
-            status="pending",
-            created_at=datetime.now(),
-            updated_at=datetime.now()
-        )
+        # Same fields as the Transaction model, built directly since the
+        # values are already validated by PaymentRequest
+        transaction = {
+            "id": secrets.token_urlsafe(12),
+            "order_id": order_id,
+            "amount": payment.amount,
+            "currency": payment.currency,
+            "customer_email": payment.customer_email,
+            "status": "pending",
+            "created_at": now,
+            "updated_at": now
+        }
         
-        transactions_db.append(transaction.dict())
+        # Enqueue first so a failure here can't leave a stored row behind
+        log_webhook({"event": "payment_created", "order_id": order_id})
         
-        background_tasks.add_task(
-            log_webhook,
-            {"event": "payment_created", "order_id": order_id}
-        )
+        index_transaction(transaction)
         
         return PaymentResponse(
             success=True,
@@ -139,39 +348,64 @@ async def create_payment(payment: PaymentRequest, background_tasks: BackgroundTa
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Payment creation failed: {str(e)}")
 
-@app.get("/api/v1/transactions")
+# The handler returns an ORJSONResponse itself, so response_model only documents
+# the shape and rows are not re-validated
+@app.get("/api/v1/transactions", response_model=TransactionList)
 async def get_transactions(
     email: Optional[str] = None,
     status: Optional[str] = None,
-    limit: int = 50
+    limit: int = Query(50, ge=0),
+    if_none_match: Optional[str] = Header(None)
 ):
-    filtered_transactions = transactions_db
-    
-    if email:
-        filtered_transactions = [t for t in filtered_transactions if t["customer_email"] == email]
+    etag = f'"{_BOOT_ID}-{transactions_version}"'
+    if if_none_match == etag:
+        return Response(status_code=304, headers={"ETag": etag})
     
-    if status:
-        filtered_transactions = [t for t in filtered_transactions if t["status"] == status]
+    if email and status:
+        by_email = transactions_by_email.get(email, [])
+        by_status = transactions_by_status.get(status, {})
+        # One pass over the smaller bucket, checking the other field
+        if len(by_email) <= len(by_status):
+            matches = [t for t in by_email if t["status"] == status]
+        else:
+            matches = creation_order(t for t in by_status.values() if t["customer_email"] == email)
+        count = len(matches)
+        page = matches[:limit]
+    elif email:
+        bucket = transactions_by_email.get(email, [])
+        count = len(bucket)
+        page = bucket[:limit]
+    elif status:
+        bucket = transactions_by_status.get(status, {})
+        count = len(bucket)
+        page = creation_order(bucket.values(), limit)
+    else:
+        count = len(transactions_db)
+        page = list(islice(transactions_db, limit))
     
-    return {
-        "count": len(filtered_transactions),
-        "transactions": filtered_transactions[:limit]
-    }
+    # Rows hold only str/float values, so orjson can encode them directly
+    # without a jsonable_encoder pass
+    return ORJSONResponse({
+        "count": count,
+        "transactions": page
+    }, headers={"ETag": etag})
 
 @app.post("/api/v1/webhooks/payment")
-async def payment_webhook(request: Request, background_tasks: BackgroundTasks):
+async def payment_webhook(request: Request):
     try:
-        payload = await request.json()
+        payload = orjson.loads(await request.body())
+        if not isinstance(payload, dict):
+            raise HTTPException(status_code=400, detail="Webhook payload must be a JSON object")
         order_id = payload.get("order_id")
+        new_status = payload.get("status", "completed")
         
         if not order_id:
             raise HTTPException(status_code=400, detail="Order ID not found")
-        
-        for transaction in transactions_db:
-            if transaction["order_id"] == order_id:
-                transaction["status"] = payload.get("status", "completed")
-                transaction["updated_at"] = datetime.now().isoformat()
-                break
+        # Checked before acknowledging, since the flusher applies these later
+        if not isinstance(order_id, str):
+            raise HTTPException(status_code=400, detail="Order ID must be a string")
+        if not isinstance(new_status, str):
+            raise HTTPException(status_code=400, detail="Status must be a string")
         
         webhook_data = {
             "order_id": order_id,
@@ -180,27 +414,26 @@ async def payment_webhook(request: Request, background_tasks: BackgroundTasks):
             "raw_payload": payload
         }
         
-        background_tasks.add_task(log_webhook, webhook_data)
+        # Acknowledge right away; the flusher applies the status update
+        log_webhook(webhook_data, new_status)
         
         return {
             "success": True,
-            "message": "Webhook processed successfully",
+            "message": "Webhook accepted",
             "order_id": order_id
         }
         
-    except json.JSONDecodeError:
+    except HTTPException:
+        raise
+    except orjson.JSONDecodeError:
         raise HTTPException(status_code=400, detail="Invalid JSON")
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Webhook processing failed: {str(e)}")
 
 @app.get("/api/v1/health")
 async def health_check():
-    return {
-        "status": "healthy",
-        "timestamp": datetime.now().isoformat(),
-        "transactions_count": len(transactions_db),
-        "webhooks_count": len(webhook_logs)
-    }
+    body = _HEALTH_TMPL % (isoformat_now().encode(), len(transactions_db), webhook_logs_total)
+    return Response(content=body, media_type="application/json")
 
 if __name__ == "__main__":
     import uvicorn
@@ -1,6 +1,19 @@
 import os
+import uvicorn
 
 host = os.getenv("HOST", "127.0.0.1")  # Default to localhost
 port = int(os.getenv("PORT", 8000))
+reload = os.getenv("ENV") == "development"
+# The transaction store is in-memory and per-process, so default to one worker
+workers = int(os.getenv("WORKERS", 1))
 
-uvicorn.run("main:app", host=host, port=port, reload=(os.getenv("ENV") == "development"))
\ No newline at end of file
+# loop/http stay at uvicorn's "auto", which picks uvloop and httptools when
+# installed (uvicorn[standard] skips uvloop on Windows, cygwin and PyPy)
+uvicorn.run(
+    "main:app",
+    host=host,
+    port=port,
+    reload=reload,
+    workers=None if reload else workers,
+    access_log=os.getenv("ACCESS_LOG", "false").lower() == "true",
+)
@@ -4,10 +4,22 @@ Streamlit interface for payment processing
 """
 import streamlit as st
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import json
+import orjson
 import pandas as pd
+try:
+    import pyarrow as pa
+except ImportError:  # pyarrow normally ships with streamlit
+    pa = None
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+import io
+import threading
 import time
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
 
 # Page configuration
 st.set_page_config(
@@ -18,7 +30,7 @@ st.set_page_config(
 )
 
 # Custom CSS for better UI
-st.markdown("""
+CUSTOM_CSS = """
 <style>
     .main-header {
         font-size: 2.5rem;
@@ -51,7 +63,7 @@ st.markdown("""
         margin-bottom: 2rem;
     }
 </style>
-""", unsafe_allow_html=True)
+"""
 
 # Configuration
 BACKEND_URL = "http://localhost:8000"  # Change to your backend URL
@@ -61,28 +73,163 @@ if 'transactions' not in st.session_state:
     st.session_state.transactions = []
 if 'last_order_id' not in st.session_state:
     st.session_state.last_order_id = None
+if 'webhook_status' not in st.session_state:
+    st.session_state.webhook_status = {}  # order_id -> webhook delivered (bool)
 
 # Helper functions
-def call_backend(endpoint, method="GET", data=None):
-    """Helper to call backend API"""
+@st.cache_resource
+def get_session():
+    """Shared HTTP session so backend connections are reused across reruns"""
+    session = requests.Session()
+    adapter = HTTPAdapter(
+        pool_connections=50,
+        pool_maxsize=50,
+        max_retries=Retry(total=3, backoff_factor=0.1)
+    )
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+ETAG_CACHE_SIZE = 64
+
+class EtagCache:
+    """LRU of the last (ETag, body) per conditional GET URL and params"""
+
+    def __init__(self, maxsize=ETAG_CACHE_SIZE):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()  # prefetch threads share the cache
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def put(self, key, etag, body):
+        with self._lock:
+            self._entries[key] = (etag, body)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+@st.cache_resource
+def get_etag_cache():
+    """ETag cache shared across sessions"""
+    return EtagCache()
+
+class BackendError(Exception):
+    """A backend call failed; the message is shown to the user"""
+
+def fetch_backend(endpoint, method="GET", data=None, params=None, conditional=False):
+    """Call the backend API without rendering anything; raises BackendError
+
+    With ``conditional=True`` a GET sends the last ETag seen for the URL and
+    reuses the stored body when the backend answers 304 Not Modified.
+    """
     url = f"{BACKEND_URL}{endpoint}"
+    cache_key = (url, tuple(sorted((params or {}).items())))
+    session = get_session()
     try:
         if method == "GET":
-            response = requests.get(url, timeout=10)
+            cached = get_etag_cache().get(cache_key) if conditional else None
+            headers = {"If-None-Match": cached[0]} if cached else None
+            response = session.get(url, params=params, headers=headers, timeout=10)
+            if cached and response.status_code == 304:
+                return cached[1]
         elif method == "POST":
-            response = requests.post(url, json=data, timeout=10)
+            response = session.post(
+                url,
+                data=orjson.dumps(data),
+                headers={"Content-Type": "application/json"},
+                timeout=10
+            )
         else:
             return {"error": f"Unsupported method: {method}"}
         
         response.raise_for_status()
-        return response.json()
-    except requests.exceptions.RequestException as e:
+        if method == "POST":
+            # Server state changed, so cached GET results are stale
+            clear_backend_cache()
+        result = orjson.loads(response.content)
+        if conditional and "ETag" in response.headers:
+            get_etag_cache().put(cache_key, response.headers["ETag"], result)
+        return result
+    except (requests.exceptions.RequestException, orjson.JSONDecodeError) as e:
+        raise BackendError(str(e)) from e
+
+def call_backend(endpoint, method="GET", data=None, params=None, conditional=False):
+    """Helper to call backend API"""
+    try:
+        return fetch_backend(endpoint, method, data, params, conditional)
+    except BackendError as e:
         st.error(f"API Error: {str(e)}")
         return None
 
-def simulate_webhook(order_id, status="success"):
-    """Simulate sending a webhook (for demo purposes)"""
-    webhook_data = {
+def show_cached(fetch, *args):
+    """Call a cached fetch function, rendering a failure once from the script thread"""
+    try:
+        return fetch(*args)
+    except BackendError as e:
+        st.error(f"API Error: {str(e)}")
+        return None
+
+# Cached fetches render nothing (cached st.* calls would be replayed on every
+# hit) and raise BackendError on failure, so errors are not cached either;
+# call them through show_cached()
+@st.cache_data(ttl=5)
+def get_health():
+    """Cached backend health check"""
+    return fetch_backend("/api/v1/health")
+
+@st.cache_data(ttl=5)
+def get_transactions(email, status):
+    """Cached transaction list for the given filters"""
+    params = {}
+    if email:
+        params["email"] = email
+    if status != "All":
+        params["status"] = status
+    return fetch_backend("/api/v1/transactions", params=params, conditional=True)
+
+def fetch_concurrently(*calls):
+    """Run independent backend calls in parallel so their round trips overlap"""
+    ctx = get_script_run_ctx()
+
+    def run(call):
+        # Worker threads need the script context for st.cache_data
+        add_script_run_ctx(threading.current_thread(), ctx)
+        try:
+            return call()
+        except BackendError:
+            # Not cached; the script thread's own call retries and shows the error
+            return None
+
+    with ThreadPoolExecutor(max_workers=len(calls)) as pool:
+        return list(pool.map(run, calls))
+
+def transactions_frame(rows):
+    """Build the transactions DataFrame column-wise through Arrow when available"""
+    if pa is None:
+        return pd.DataFrame(rows)
+    return pa.Table.from_pylist(rows).to_pandas(types_mapper=pd.ArrowDtype)
+
+@st.cache_data(max_entries=16, ttl=300)
+def transactions_csv(df):
+    """CSV export of a transactions table, so reruns don't re-encode an unchanged table"""
+    buf = io.BytesIO()
+    df.to_csv(buf, index=False, chunksize=10_000)
+    return buf.getvalue()
+
+def clear_backend_cache():
+    """Drop cached GET results after the backend state changes"""
+    get_health.clear()
+    get_transactions.clear()
+
+def webhook_payload(order_id, status="success"):
+    """Build a simulated gateway webhook payload"""
+    return {
         "event": "payment.captured",
         "order_id": order_id,
         "payment_id": f"pay_{int(time.time())}",
@@ -90,36 +237,74 @@ def simulate_webhook(order_id, status="success"):
         "status": status,
         "timestamp": datetime.now().isoformat()
     }
+
+def simulate_webhook(order_id, status="success"):
+    """Simulate sending a webhook (for demo purposes)"""
+    webhook_data = webhook_payload(order_id, status)
     
     try:
-        response = requests.post(
+        response = get_session().post(
             f"{BACKEND_URL}/api/v1/webhooks/payment",
             json=webhook_data,
             timeout=5
         )
+        clear_backend_cache()
         return response.status_code == 200
     except requests.exceptions.RequestException as e:
         st.error(f"Cannot connect to backend: {str(e)}")
 
+def delayed_webhook(session, order_id, results):
+    """Send the success webhook after a short delay, off the script thread.
+
+    Runs without a script context, so it records the outcome in ``results``
+    instead of calling Streamlit elements.
+    """
+    time.sleep(2)
+    try:
+        response = session.post(
+            f"{BACKEND_URL}/api/v1/webhooks/payment",
+            json=webhook_payload(order_id),
+            timeout=5
+        )
+        results[order_id] = response.status_code == 200
+    except requests.exceptions.RequestException:
+        results[order_id] = False
+    clear_backend_cache()
+
 # Main application
 def main():
+    # Streamlit drops elements a rerun doesn't emit, so the styles are sent
+    # every run; only the string itself is built once at import
+    st.markdown(CUSTOM_CSS, unsafe_allow_html=True)
+    
     # Header
     st.markdown('<h1 class="main-header">💳 Payment Portal Demo</h1>', unsafe_allow_html=True)
     st.markdown("A complete payment gateway integration demonstration")
     
+    # Warm the health and transaction caches together instead of one after the other
+    if st.session_state.get("page") == "Transaction History":
+        fetch_concurrently(
+            get_health,
+            lambda: get_transactions(
+                st.session_state.get("tx_filter_email", ""),
+                st.session_state.get("tx_filter_status", "All")
+            )
+        )
+    
     # Sidebar
     with st.sidebar:
         st.title("Navigation")
         page = st.radio(
             "Go to:",
-            ["Make Payment", "Transaction History", "API Testing", "Architecture"]
+            ["Make Payment", "Transaction History", "API Testing", "Architecture"],
+            key="page"
         )
         
         st.markdown("---")
         st.subheader("API Status")
         
         # Health check
-        health_data = call_backend("/api/v1/health")
+        health_data = show_cached(get_health)
         if health_data:
             st.success(f"✅ Backend: {health_data['status']}")
             st.info(f"Transactions: {health_data['transactions_count']}")
@@ -169,7 +354,8 @@ def show_payment_page():
                 with col_a:
                     submit_button = st.form_submit_button("Process Payment", use_container_width=True)
                 with col_b:
-                    clear_button = st.form_submit_button("Clear Form", use_container_width=True)
+                    # Submitting the form already reruns the script
+                    st.form_submit_button("Clear Form", use_container_width=True)
                 
                 st.markdown('</div>', unsafe_allow_html=True)
                 
@@ -212,17 +398,16 @@ def show_payment_page():
                                 </div>
                                 """, unsafe_allow_html=True)
                             
-                            # Simulate webhook after delay
+                            # Simulate webhook after delay, without blocking the UI
                             st.info("Simulating payment completion...")
-                            time.sleep(2)
-                            if simulate_webhook(result["order_id"]):
-                                st.success("✅ Payment completed! Webhook received and processed.")
+                            threading.Thread(
+                                target=delayed_webhook,
+                                args=(get_session(), result["order_id"], st.session_state.webhook_status),
+                                daemon=True
+                            ).start()
                         
                         else:
                             st.error("Payment failed. Please try again.")
-                
-                if clear_button:
-                    st.experimental_rerun()
         
         with col2:
             st.markdown('<div class="info-box">', unsafe_allow_html=True)
@@ -245,6 +430,15 @@ def show_payment_page():
                 st.subheader("Last Payment")
                 st.code(f"Order ID: {st.session_state.last_order_id}")
                 
+                delivered = st.session_state.webhook_status.get(st.session_state.last_order_id)
+                if delivered is None:
+                    st.caption("⏳ Waiting for payment webhook...")
+                    st.button("Check Status")
+                elif delivered:
+                    st.success("✅ Payment completed! Webhook received and processed.")
+                else:
+                    st.error("Webhook delivery failed")
+                
                 if st.button("Simulate Failed Payment"):
                     if simulate_webhook(st.session_state.last_order_id, "failed"):
                         st.error("Simulated payment failure")
@@ -253,42 +447,42 @@ def show_transactions_page():
     """Display transaction history"""
     st.markdown('<h2 class="sub-header">📊 Transaction History</h2>', unsafe_allow_html=True)
     
-    # Filter options
-    col1, col2, col3 = st.columns(3)
-    with col1:
-        filter_email = st.text_input("Filter by Email")
-    with col2:
-        filter_status = st.selectbox("Filter by Status", ["All", "pending", "success", "failed"])
-    with col3:
-        refresh_btn = st.button("Refresh Data", type="secondary")
+    # Filter options (in a form, so typing doesn't trigger a fetch per keystroke;
+    # the widget values in session_state only change on submit)
+    with st.form("tx_filters"):
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            filter_email = st.text_input("Filter by Email", key="tx_filter_email")
+        with col2:
+            filter_status = st.selectbox(
+                "Filter by Status", ["All", "pending", "success", "failed"], key="tx_filter_status"
+            )
+        with col3:
+            st.form_submit_button("Apply Filters")
+            # Clear in the callback: it runs before main(), so the prefetch is the fresh fetch
+            st.form_submit_button("Refresh Data", type="secondary", on_click=clear_backend_cache)
     
     # Fetch transactions
-    endpoint = "/api/v1/transactions"
-    if filter_email:
-        endpoint += f"?email={filter_email}"
-        if filter_status != "All":
-            endpoint += f"&status={filter_status}"
-    elif filter_status != "All":
-        endpoint += f"?status={filter_status}"
-    
-    transactions_data = call_backend(endpoint)
+    transactions_data = show_cached(get_transactions, filter_email, filter_status)
     
     if transactions_data and transactions_data.get("transactions"):
-        df = pd.DataFrame(transactions_data["transactions"])
+        df = transactions_frame(transactions_data["transactions"])
         
-        # Format datetime columns
+        # Format datetime columns (parsed once; the parsed created_at is reused
+        # for the timeline chart)
+        created_at = None
         if 'created_at' in df.columns:
-            df['created_at'] = pd.to_datetime(df['created_at'])
-            df['created_at'] = df['created_at'].dt.strftime('%Y-%m-%d %H:%M')
+            created_at = pd.to_datetime(df['created_at'], format='ISO8601')
+            df['created_at'] = created_at.dt.strftime('%Y-%m-%d %H:%M')
         
         if 'updated_at' in df.columns:
-            df['updated_at'] = pd.to_datetime(df['updated_at'])
-            df['updated_at'] = df['updated_at'].dt.strftime('%Y-%m-%d %H:%M')
+            df['updated_at'] = pd.to_datetime(df['updated_at'], format='ISO8601').dt.strftime('%Y-%m-%d %H:%M')
         
         # Display metrics
-        total_amount = df['amount'].sum()
-        success_count = len(df[df['status'] == 'success'])
-        pending_count = len(df[df['status'] == 'pending'])
+        status_counts = df['status'].value_counts()  # one pass, reused by the chart
+        total_amount = df['amount'].to_numpy().sum()
+        success_count = int(status_counts.get('success', 0))
+        pending_count = int(status_counts.get('pending', 0))
         
         metric_col1, metric_col2, metric_col3 = st.columns(3)
         with metric_col1:
@@ -302,10 +496,9 @@ def show_transactions_page():
         st.dataframe(df, use_container_width=True, hide_index=True)
         
         # Download option
-        csv = df.to_csv(index=False)
         st.download_button(
             label="Download as CSV",
-            data=csv,
+            data=transactions_csv(df),
             file_name=f"transactions_{datetime.now().strftime('%Y%m%d_%H%M')}.csv",
             mime="text/csv"
         )
@@ -315,13 +508,12 @@ def show_transactions_page():
         chart_col1, chart_col2 = st.columns(2)
         
         with chart_col1:
-            status_counts = df['status'].value_counts()
             if not status_counts.empty:
                 st.bar_chart(status_counts)
         
         with chart_col2:
-            if 'created_at' in df.columns and len(df) > 1:
-                timeline_df = df.groupby(pd.to_datetime(df['created_at']).dt.date).size()
+            if created_at is not None and len(df) > 1:
+                timeline_df = df.groupby(created_at.dt.date).size()
                 st.line_chart(timeline_df)
     else:
         st.info("No transactions found. Make a payment first!")
@@ -359,27 +551,28 @@ def show_api_testing_page():
                                 value=st.session_state.last_order_id or "ORD20240320123456ABC123")
         webhook_status = st.selectbox("Webhook Status", ["success", "failed", "pending"])
         
-        webhook_payload = {
+        # Preview only; the real payment_id and timestamp are filled in on send
+        st.json({
             "event": "payment.captured",
             "order_id": order_id,
-            "payment_id": f"pay_{int(time.time())}",
+            "payment_id": "pay_<unix time>",
             "amount": 100.0,
             "status": webhook_status,
-            "timestamp": datetime.now().isoformat()
-        }
-        
-        st.json(webhook_payload)
+            "timestamp": "<ISO 8601 timestamp>"
+        })
         
         if st.button("Send Test Webhook"):
+            payload = webhook_payload(order_id, webhook_status)
             with st.spinner("Sending webhook..."):
                 try:
-                    response = requests.post(
+                    response = get_session().post(
                         f"{BACKEND_URL}/api/v1/webhooks/payment",
-                        json=webhook_payload,
+                        json=payload,
                         timeout=5
                     )
                     
                     if response.status_code == 200:
+                        clear_backend_cache()
                         st.success("✅ Webhook sent successfully!")
                         st.json(response.json())
                     else: